@@ -1,10 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, g
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-from datetime import timedelta, datetime
+from flask_jwt_extended import JWTManager, create_access_token, get_jwt_identity, get_jwt, verify_jwt_in_request
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
+from datetime import timedelta, datetime, timezone
+import hashlib
 import json
+import orjson
 import os
+import re
+import sqlite3
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -12,6 +23,37 @@ load_dotenv()
 
 app = Flask(__name__)
 
+# Serialize responses with orjson (C-implemented) instead of the stdlib json
+class OrjsonProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+app.json = OrjsonProvider(app)
+
+def read_json_body():
+    """Parse the request body with orjson, without caching the raw bytes on the request"""
+    return orjson.loads(request.get_data(cache=False, as_text=False))
+
+# Pre-built body templates for the fixed-shape success responses. Dynamic
+# parts are interpolated as already-serialized JSON fragments, skipping the
+# dict build and full orjson pass on the hot path.
+_REGISTER_OK_TPL = b'{"message":"User created successfully","access_token":%b,"user":{"email":%b,"name":%b}}'
+_LOGIN_OK_TPL = b'{"message":"Login successful","access_token":%b,"user":{"email":%b,"name":%b}}'
+_PROFILE_TPL = b'{"email":%b,"name":%b,"created_at":%b,"papers_count":%d}'
+_PAPERS_TPL = b'{"papers":%b}'
+_SUBMIT_OK_TPL = b'{"message":"Paper submitted successfully","paper":%b}'
+
+def _json_str(s):
+    """Serialize a single string to a quoted, escaped JSON fragment"""
+    return orjson.dumps(s)
+
+def raw_response(body, status=200):
+    """Build a response from an already-serialized JSON body"""
+    return app.response_class(body, status=status, mimetype='application/json')
+
 # Configuration
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'your-secret-key-change-this-in-production')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=7)
@@ -19,23 +61,274 @@ app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(days=7)
 # Enable CORS
 CORS(app, origins=['http://localhost:*', 'http://127.0.0.1:*', 'https://*.github.io', 'https://hammerdirt-analyst.github.io', 'file://*'], methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'], allow_headers=['Content-Type', 'Authorization'])
 
+# Answer CORS preflights directly: the browser sends an OPTIONS before every
+# authorized POST, and flask-cors runs its full origin-matching pipeline for
+# each one. The allowed origins compile once into a single pattern and the
+# static headers are pre-built; only Allow-Origin is filled in per request.
+_ALLOWED_ORIGIN_RE = re.compile(
+    r'^(http://localhost:.*|http://127\.0\.0\.1:.*|https://.*\.github\.io'
+    r'|https://hammerdirt-analyst\.github\.io|file://.*)$'
+)
+_PREFLIGHT_HEADERS = {
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Max-Age': '86400',
+    'Vary': 'Origin',
+}
+
+@app.before_request
+def _fast_preflight():
+    """Short-circuit CORS preflights before route dispatch"""
+    if request.method != 'OPTIONS':
+        return None
+    origin = request.headers.get('Origin')
+    if origin is None or _ALLOWED_ORIGIN_RE.match(origin) is None:
+        return None  # fall through to flask-cors for disallowed origins
+    headers = dict(_PREFLIGHT_HEADERS)
+    headers['Access-Control-Allow-Origin'] = origin
+    return app.response_class(b'', status=204, headers=headers)
+
 # Initialize JWT
 jwt = JWTManager(app)
 
-# Simple file-based database (for demo - in production use a real database)
-USERS_FILE = 'users.json'
+# SQLite-backed storage. WAL mode keeps readers off the writer's lock and
+# mmap_size lets reads come straight from the OS page cache. The connection
+# is opened lazily per process — never at import — so a preloading server
+# (gunicorn --preload) cannot carry an open connection across fork(), which
+# is SQLite's documented corruption scenario.
+DB_FILE = 'users.db'
+USERS_FILE = 'users.json'  # legacy JSON store, imported once on first run
+
+_db = None
+_db_pid = None
+_db_init_lock = threading.Lock()
+
+# Serializes writes between this process's request threads
+_db_lock = threading.Lock()
+
+def _connect():
+    """Open and initialize this process's SQLite connection"""
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA mmap_size=268435456')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript('''
+        CREATE TABLE IF NOT EXISTS users (
+            email TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT '',
+            password_hash TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS papers (
+            email TEXT NOT NULL REFERENCES users(email),
+            id INTEGER NOT NULL,
+            title TEXT,
+            authors TEXT,
+            abstract TEXT,
+            submitted_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            PRIMARY KEY (email, id)
+        );
+    ''')
+    return conn
+
+def get_db():
+    """Return this process's SQLite connection, opening it on first use"""
+    global _db, _db_pid
+    if _db is None or _db_pid != os.getpid():
+        with _db_init_lock:
+            if _db is None or _db_pid != os.getpid():
+                conn = _connect()
+                _import_legacy_users(conn)
+                _db = conn
+                _db_pid = os.getpid()
+    return _db
+
+def _utcnow():
+    """Current UTC time as an ISO-8601 string"""
+    return datetime.now(timezone.utc).isoformat()
+
+# Process-local cache of user rows so repeat lookups skip SQLite entirely
+_USERS_CACHE = {}
+
+def _import_legacy_users(conn):
+    """One-time import of the old users.json store into SQLite"""
+    if not os.path.exists(USERS_FILE):
+        return
+    if conn.execute('SELECT 1 FROM users LIMIT 1').fetchone():
+        return
+    with open(USERS_FILE, 'r') as f:
+        users = json.load(f)
+    with conn:
+        for email, user in users.items():
+            conn.execute(
+                'INSERT OR IGNORE INTO users (email, name, password_hash, created_at) VALUES (?, ?, ?, ?)',
+                (email, user.get('name') or '', user['password_hash'], user.get('created_at', ''))
+            )
+            for paper in user.get('papers', []):
+                conn.execute(
+                    'INSERT OR IGNORE INTO papers (email, id, title, authors, abstract, submitted_at, status) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (email, paper.get('id'), paper.get('title'), paper.get('authors'),
+                     paper.get('abstract'), paper.get('submitted_at', ''), paper.get('status', 'submitted'))
+                )
+
+def get_user(email):
+    """Look up a user row, serving repeat lookups from the in-process cache"""
+    user = _USERS_CACHE.get(email)
+    if user is None:
+        row = get_db().execute(
+            'SELECT password_hash, name, created_at FROM users WHERE email = ?', (email,)
+        ).fetchone()
+        if row is None:
+            return None
+        user = {'password_hash': row[0], 'name': row[1], 'created_at': row[2]}
+        _USERS_CACHE[email] = user
+    return user
 
-def load_users():
-    """Load users from JSON file"""
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+def create_user(email, name, password_hash, created_at):
+    """Insert a new user; returns False if the email is already taken"""
+    try:
+        db = get_db()
+        with _db_lock, db:
+            db.execute(
+                'INSERT INTO users (email, name, password_hash, created_at) VALUES (?, ?, ?, ?)',
+                (email, name, password_hash, created_at)
+            )
+    except sqlite3.IntegrityError as e:
+        # Only a duplicate email means "already exists"; any other
+        # constraint failure is a real error and should surface
+        if 'UNIQUE constraint failed' not in str(e):
+            raise
+        return False
+    _USERS_CACHE[email] = {'password_hash': password_hash, 'name': name, 'created_at': created_at}
+    return True
+
+def get_papers(email):
+    """Return a user's papers as a list of dicts, oldest first"""
+    rows = get_db().execute(
+        'SELECT id, title, authors, abstract, submitted_at, status FROM papers WHERE email = ? ORDER BY id',
+        (email,)
+    ).fetchall()
+    return [
+        {'id': r[0], 'title': r[1], 'authors': r[2], 'abstract': r[3],
+         'submitted_at': r[4], 'status': r[5]}
+        for r in rows
+    ]
+
+def count_papers(email):
+    """Count a user's submitted papers"""
+    return get_db().execute('SELECT COUNT(*) FROM papers WHERE email = ?', (email,)).fetchone()[0]
+
+def add_paper(email, paper):
+    """Insert a paper row, assigning the next per-user id in the same statement;
+    returns the assigned id"""
+    db = get_db()
+    with _db_lock, db:
+        row = db.execute(
+            'INSERT INTO papers (email, id, title, authors, abstract, submitted_at, status) '
+            'VALUES (?, COALESCE((SELECT MAX(id) FROM papers WHERE email = ?), 0) + 1, ?, ?, ?, ?, ?) '
+            'RETURNING id',
+            (email, email, paper['title'], paper['authors'], paper['abstract'],
+             paper['submitted_at'], paper['status'])
+        ).fetchone()
+    return row[0]
+
+# Argon2 (native libargon2) replaces werkzeug's pure-Python PBKDF2 for new
+# hashes; legacy werkzeug hashes still verify and are upgraded on login
+ph = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+
+# Hashing runs on a pool of real OS threads: libargon2 releases the GIL, so
+# concurrent signups hash on multiple cores. Under gunicorn's gevent worker
+# the stdlib pool's threads are monkey-patched into greenlets, and ph.hash
+# (a non-yielding C call) would block the worker's event loop for the whole
+# hash — so gevent's native threadpool is used there instead: its threads
+# are not greenlets and waiting on its futures yields to the hub. The pool
+# is built per process on first use because gevent patches after fork, so
+# an import-time choice (especially under --preload) would see the wrong
+# runtime.
+_hash_pool = None
+_hash_pool_pid = None
+_hash_pool_init_lock = threading.Lock()
+
+def _make_hash_pool():
+    """Pick the hashing pool implementation for this process's runtime"""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched('threading'):
+            from gevent.threadpool import ThreadPoolExecutor as GeventThreadPoolExecutor
+            return GeventThreadPoolExecutor(max_workers=os.cpu_count())
+    except ImportError:
+        pass
+    return ThreadPoolExecutor(max_workers=os.cpu_count())
+
+def _get_hash_pool():
+    """Return this process's hashing pool, building it on first use"""
+    global _hash_pool, _hash_pool_pid
+    if _hash_pool is None or _hash_pool_pid != os.getpid():
+        with _hash_pool_init_lock:
+            if _hash_pool is None or _hash_pool_pid != os.getpid():
+                _hash_pool = _make_hash_pool()
+                _hash_pool_pid = os.getpid()
+    return _hash_pool
 
-def save_users(users):
-    """Save users to JSON file"""
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=2)
+def verify_password(stored_hash, password):
+    """Verify a password against an argon2 or legacy werkzeug hash"""
+    if stored_hash.startswith('$argon2'):
+        try:
+            ph.verify(stored_hash, password)
+            return True
+        except (VerificationError, InvalidHashError):
+            return False
+    return check_password_hash(stored_hash, password)
+
+def update_password_hash(email, password_hash):
+    """Store a re-hashed password for an existing user"""
+    db = get_db()
+    with _db_lock, db:
+        db.execute('UPDATE users SET password_hash = ? WHERE email = ?', (password_hash, email))
+    user = _USERS_CACHE.get(email)
+    if user is not None:
+        user['password_hash'] = password_hash
+
+# Verified against this when the email is unknown, so login burns the same
+# hash cost whether or not the account exists (no timing oracle)
+_DUMMY_HASH = ph.hash('x' * 32)
+
+# Tokens are signed with HS256 (flask-jwt-extended's default) using the key
+# configured above. Verified tokens are cached so hot clients skip the
+# HMAC + base64 + JSON decode on every request; a cached entry is only
+# trusted until the token's own exp claim. The cache is keyed on a SHA-256
+# digest of the token, not the raw string: dict probes then compare
+# fixed-length digests instead of short-circuiting byte-by-byte over
+# attacker-supplied secret material, and no bearer token is retained.
+_JWT_CACHE = {}
+_JWT_CACHE_MAX = 4096
+
+def jwt_required_cached(fn):
+    """Like flask-jwt-extended's @jwt_required(), but skips re-verification of recently seen tokens"""
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        auth = request.headers.get('Authorization', '')
+        token = auth[7:] if auth.startswith('Bearer ') else None
+        token_key = hashlib.sha256(token.encode()).digest() if token is not None else None
+        if token_key is not None:
+            cached = _JWT_CACHE.get(token_key)
+            if cached is not None and cached[1] > time.time():
+                g.jwt_identity = cached[0]
+                return fn(*args, **kwargs)
+        verify_jwt_in_request()
+        identity = get_jwt_identity()
+        g.jwt_identity = identity
+        if token_key is not None:
+            if len(_JWT_CACHE) >= _JWT_CACHE_MAX:
+                _JWT_CACHE.pop(next(iter(_JWT_CACHE)))
+            _JWT_CACHE[token_key] = (identity, get_jwt()['exp'])
+        return fn(*args, **kwargs)
+    return wrapper
+
+def current_identity():
+    """Identity of the authenticated caller (set by jwt_required_cached)"""
+    return g.jwt_identity
 
 # Routes
 @app.route('/health', methods=['GET'])
@@ -47,44 +340,32 @@ def health_check():
 def register():
     """Register a new user"""
     try:
-        data = request.get_json()
+        data = read_json_body()
         email = data.get('email')
         password = data.get('password')
-        name = data.get('name', '')
+        name = data.get('name') or ''
         
         if not email or not password:
             return jsonify({'error': 'Email and password are required'}), 400
         
-        # Load existing users
-        users = load_users()
-        
-        # Check if user already exists
-        if email in users:
+        # Hash on the pool while we check for an existing account, then
+        # insert (the insert itself still fails if the email is taken)
+        hash_future = _get_hash_pool().submit(ph.hash, password)
+        if get_user(email) is not None:
+            hash_future.cancel()
             return jsonify({'error': 'User already exists'}), 409
-        
-        # Create new user
-        users[email] = {
-            'email': email,
-            'name': name,
-            'password_hash': generate_password_hash(password),
-            'created_at': str(datetime.now()),
-            'papers': []  # Store submitted papers
-        }
-        
-        # Save users
-        save_users(users)
-        
+
+        created = create_user(email, name, hash_future.result(), _utcnow())
+        if not created:
+            return jsonify({'error': 'User already exists'}), 409
+
         # Create access token
         access_token = create_access_token(identity=email)
         
-        return jsonify({
-            'message': 'User created successfully',
-            'access_token': access_token,
-            'user': {
-                'email': email,
-                'name': name
-            }
-        }), 201
+        return raw_response(
+            _REGISTER_OK_TPL % (_json_str(access_token), _json_str(email), _json_str(name)),
+            status=201
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -93,128 +374,112 @@ def register():
 def login():
     """Login user"""
     try:
-        data = request.get_json()
+        data = read_json_body()
         email = data.get('email')
         password = data.get('password')
         
         if not email or not password:
             return jsonify({'error': 'Email and password are required'}), 400
         
-        # Load users
-        users = load_users()
-        
-        # Check if user exists
-        if email not in users:
-            return jsonify({'error': 'Invalid credentials'}), 401
-        
-        # Verify password
-        user = users[email]
-        if not check_password_hash(user['password_hash'], password):
+        # Always run exactly one hash verification, against a dummy hash when
+        # the email is unknown, and combine the checks without short-circuiting
+        user = get_user(email)
+        stored_hash = user['password_hash'] if user is not None else _DUMMY_HASH
+        verify_ok = verify_password(stored_hash, password)
+        if not ((user is not None) & verify_ok):
             return jsonify({'error': 'Invalid credentials'}), 401
-        
+
+        # Transparently upgrade legacy werkzeug or outdated argon2 hashes
+        if not stored_hash.startswith('$argon2') or ph.check_needs_rehash(stored_hash):
+            update_password_hash(email, ph.hash(password))
+
         # Create access token
         access_token = create_access_token(identity=email)
         
-        return jsonify({
-            'message': 'Login successful',
-            'access_token': access_token,
-            'user': {
-                'email': email,
-                'name': user.get('name', '')
-            }
-        }), 200
+        return raw_response(
+            _LOGIN_OK_TPL % (_json_str(access_token), _json_str(email), _json_str(user['name']))
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/profile', methods=['GET'])
-@jwt_required()
+@jwt_required_cached
 def get_profile():
     """Get user profile (protected route)"""
     try:
-        email = get_jwt_identity()
-        users = load_users()
-        
-        if email not in users:
+        email = current_identity()
+        user = get_user(email)
+
+        if user is None:
             return jsonify({'error': 'User not found'}), 404
-        
-        user = users[email]
-        return jsonify({
-            'email': email,
-            'name': user.get('name', ''),
-            'created_at': user.get('created_at', ''),
-            'papers_count': len(user.get('papers', []))
-        }), 200
+
+        return raw_response(
+            _PROFILE_TPL % (_json_str(email), _json_str(user['name']),
+                            _json_str(user['created_at']), count_papers(email))
+        )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/submit-paper', methods=['POST'])
-@jwt_required()
+@jwt_required_cached
 def submit_paper():
     """Submit a paper (protected route)"""
     try:
-        email = get_jwt_identity()
-        data = request.get_json()
-        
-        # Get paper details
+        email = current_identity()
+        data = read_json_body()
+
+        if get_user(email) is None:
+            return jsonify({'error': 'User not found'}), 404
+
+        # Get paper details; the id is assigned by the insert itself
         paper = {
             'title': data.get('title'),
             'authors': data.get('authors'),
             'abstract': data.get('abstract'),
-            'submitted_at': str(datetime.now()),
-            'status': 'submitted',
-            'id': len(load_users().get(email, {}).get('papers', [])) + 1
+            'submitted_at': _utcnow(),
+            'status': 'submitted'
         }
-        
-        # Load users and add paper
-        users = load_users()
-        if email not in users:
-            return jsonify({'error': 'User not found'}), 404
-        
-        if 'papers' not in users[email]:
-            users[email]['papers'] = []
-        
-        users[email]['papers'].append(paper)
-        save_users(users)
-        
-        return jsonify({
-            'message': 'Paper submitted successfully',
-            'paper': paper
-        }), 201
+
+        paper['id'] = add_paper(email, paper)
+
+        return raw_response(_SUBMIT_OK_TPL % orjson.dumps(paper), status=201)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/my-papers', methods=['GET'])
-@jwt_required()
+@jwt_required_cached
 def get_my_papers():
     """Get user's submitted papers (protected route)"""
     try:
-        email = get_jwt_identity()
-        users = load_users()
-        
-        if email not in users:
+        email = current_identity()
+
+        if get_user(email) is None:
             return jsonify({'error': 'User not found'}), 404
-        
-        papers = users[email].get('papers', [])
-        return jsonify({'papers': papers}), 200
+
+        return raw_response(_PAPERS_TPL % orjson.dumps(get_papers(email)))
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Compiled once so gpt_review scans the content in a single pass without
+# allocating a lowercased copy of the whole paper
+_KEYWORDS_RE = re.compile(r'recognition|golden ratio', re.IGNORECASE)
+
 # GPT Review endpoint (placeholder for now)
 @app.route('/api/gpt-review', methods=['POST'])
-@jwt_required()
+@jwt_required_cached
 def gpt_review():
     """Simulate GPT review (placeholder - would integrate with actual GPT API)"""
     try:
-        data = request.get_json()
+        data = read_json_body()
         paper_content = data.get('content', '')
         
         # Simulate review based on content
         # In production, this would call OpenAI/Anthropic API
-        is_recognition_science = 'recognition' in paper_content.lower() or 'golden ratio' in paper_content.lower()
+        is_recognition_science = _KEYWORDS_RE.search(paper_content) is not None
         
         if is_recognition_science:
             review_result = {
@@ -252,8 +517,6 @@ def gpt_review():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    # Import datetime here to avoid issues
-    
     print("Starting Journal Backend Server...")
     print("API Endpoints:")
     print("  POST   /api/register     - Register new user")
@@ -263,5 +526,6 @@ if __name__ == '__main__':
     print("  GET    /api/my-papers    - Get user's papers (requires auth)")
     print("  POST   /api/gpt-review   - GPT review (requires auth)")
     print("\nServer running on http://localhost:5555")
-    
-    app.run(debug=True, port=5555) 
\ No newline at end of file
+
+    # Dev server only; production runs via gunicorn (see wsgi.py)
+    app.run(debug=os.getenv('FLASK_DEBUG', '1') == '1', port=5555)
\ No newline at end of file
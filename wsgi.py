@@ -0,0 +1,13 @@
+"""WSGI entry point for production servers.
+
+Run with:
+
+    gunicorn -k gevent -w 4 --preload -b 0.0.0.0:5555 wsgi:app
+
+--preload imports this module once in the master so workers fork with the
+app code, Argon2 hasher and module-level caches already built. The SQLite
+connection is deliberately NOT opened at import time: each worker opens
+its own connection on first use (see get_db() in app.py), since carrying
+an open SQLite connection across fork() risks database corruption.
+"""
+from app import app  # noqa: F401